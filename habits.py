@@ -1,6 +1,7 @@
 import os
 import re
 import logging
+from collections import defaultdict
 from datetime import datetime
 from dateutil import tz
 from todoist.api import TodoistAPI
@@ -10,6 +11,9 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 TODOIST_DATE_FORMAT = "%Y-%m-%d"
+NOTE_COUNTERS = {'Summary': 2, 'Weekly': 2, 'Streak': 1}
+
+_COUNTER_RE = re.compile(r'\d+')
 
 
 def get_token():
@@ -25,79 +29,96 @@ class Task(object):
         self.id = self.item['id']
         self.notes = notes
         self.api = api
+        self._content_prefix = self.item['content'].split(' || ', 1)[0]
+        self._due = item['due']
+        self._due_date = self._due.get('date')
+        self._due_string = self._due.get('string')
+        self._due_time_suffix = '' if 'T' not in self._due_date else 'T' + self._due_date.split('T', 1)[1]
         self.summary, self.week, self.streak = self.parse_notes()
 
     def parse_notes(self):
         """
         Reads the relevant current notes and returns them
-        Adds the note if the note does not exist
+        The last readable note of each kind wins, unreadable ones are skipped
+        Adds the note if the note does not exist (queued, committed later
+        together with the rest of the updates)
         """
-        summary = None
-        week = None
-        streak = None
+        found = {}
         for note in self.notes:
-            if note['content'].startswith('Summary:'):
-                summary = note
-            if note['content'].startswith('Weekly:'):
-                week = note
-            if note['content'].startswith('Streak:'):
-                streak = note
-        if summary is None:
-            summary = self.api.notes.add(self.id, 'Summary: 0/0 | 0%')
-        if week is None:
-            week = self.api.notes.add(self.id, 'Weekly: 0/0')
-        if streak is None:
-            streak = self.api.notes.add(self.id, 'Streak: 0 days')
+            key, sep, body = note['content'].partition(':')
+            if sep and key in NOTE_COUNTERS:
+                numbers = self._parse_counters(body, NOTE_COUNTERS[key])
+                if numbers is None:
+                    logger.warning('Ignoring note %r of item %s, could not read its counters',
+                                   note['content'], self.id)
+                else:
+                    found[key] = note, numbers
+        if 'Summary' not in found:
+            found['Summary'] = self.api.notes.add(self.id, 'Summary: 0/0 | 0%'), [0, 0]
+        if 'Weekly' not in found:
+            found['Weekly'] = self.api.notes.add(self.id, 'Weekly: 0/0'), [0, 0]
+        if 'Streak' not in found:
+            found['Streak'] = self.api.notes.add(self.id, 'Streak: 0 days'), [0]
+
+        summary, (self._sum_cur, self._sum_tot) = found['Summary']
+        week, (self._week_cur, self._week_tot) = found['Weekly']
+        streak, (self._streak,) = found['Streak']
 
         return summary, week, streak
 
-    def increase_streak(self):
-        streak = self.streak
-        res = re.search(r'(\d+)', streak['content'])
-        current_days = int(res.group(1))
-        days = '{}'.format(current_days + 1)
-        text = re.sub(r'(\d+)', days, streak['content'])
-        streak.update(content=text)
+    @staticmethod
+    def _parse_counters(body, count):
+        """
+        Reads the first count numbers from the text after the colon of a note
+        Returns None if the note was edited into something without them
+        """
+        numbers = _COUNTER_RE.findall(body)
+        if len(numbers) < count:
+            return None
+        return [int(number) for number in numbers[:count]]
+
+    @property
+    def streak_text(self):
+        return f'Streak: {self._streak} days'
+
+    @property
+    def week_text(self):
+        return f'Weekly: {self._week_cur}/{self._week_tot}'
+
+    @property
+    def summary_text(self):
+        return f'Summary: {self._sum_cur}/{self._sum_tot} | {100*self._sum_cur//self._sum_tot}%'
+
+    def _set_streak(self, days):
+        self._streak = days
+        text = self.streak_text
+        self.streak.update(content=text)
         self.update_content(text)
 
     def reset_streak(self):
-        streak = self.streak
-        days = '{}'.format(0)
-        text = re.sub(r'(\d+)', days, streak['content'])
-        streak.update(content=text)
-        self.update_content(text)
+        self._set_streak(0)
     
     def update_week(self, n = 1, weekstart = False):
         """
         Increases the week note by n days
         """
-        week = self.week
-        res = re.search(r'(\d+)\/(\d+)', week['content'])
         if weekstart:
-            days = '{}/{}'.format(n, 1)
+            self._week_cur, self._week_tot = n, 1
         else:
-            cur, tot = int(res.group(1)), int(res.group(2))
-            days = '{}/{}'.format(cur + n, tot + 1)
-        text = re.sub(r'(\d+)\/(\d+)', days, week['content'])
-        week.update(content=text)
+            self._week_cur += n
+            self._week_tot += 1
+        self.week.update(content=self.week_text)
 
     def update_summary(self, n = 1):
         """
         Increases the summary note by n days
         """
-        summary = self.summary
-        res = re.search(r'(\d+)\/(\d+)', summary['content'])
-        cur, tot = int(res.group(1)), int(res.group(2))
-        days = '{}/{}'.format(cur + n, tot + 1)
-        percentage = '{}%'.format(int(100.0*(cur + n)/(tot +1)))
-        text = re.sub(r'(\d+)\/(\d+)', days, summary['content'])
-        text = re.sub(r'(\d+)\%', percentage, text)
-        summary.update(content=text)
+        self._sum_cur += n
+        self._sum_tot += 1
+        self.summary.update(content=self.summary_text)
 
     def update_content(self, content):
-        details = self.item['content'].split(' || ')[0]
-        text = details + ' || ' + content
-        self.item.update(content=text)
+        self.item.update(content=f'{self._content_prefix} || {content}')
 
     @property
     def due_date(self):
@@ -105,13 +126,13 @@ class Task(object):
         Get the due date for the current task.
         :return:
         """
-        return self.item['due'].get('date')
+        return self._due_date
 
     def is_due(self, today):
         """
         Check if task is due.
         """
-        return today not in self.due_date
+        return not self._due_date.startswith(today)
 
     def increase(self, weekstart = False):
         """
@@ -121,7 +142,7 @@ class Task(object):
         Increase overall by 1 day.
         Increase weekly by 1 day and reset on first day of the week
         """
-        self.increase_streak()
+        self._set_streak(self._streak + 1)
         self.update_summary(n=1)
         self.update_week(n=1, weekstart = weekstart)
     
@@ -137,22 +158,25 @@ class Task(object):
             self.reset_streak()
             self.update_summary(n=0)
             self.update_week(n=0, weekstart=weekstart)
-        due_date = self.item['due'].get('date')
-        if 'T' in due_date:
-            time = due_date.split('T')[1]
-            today = today + 'T' + time
-        self.item.update_date_complete(due={'string': self.item['due'].get('string'),
-                                            'date': today})
+        today_with_time = today + self._due_time_suffix
+        self.item.update_date_complete(due={'string': self._due_string,
+                                            'date': today_with_time})
 
 class Todoist(object):
     def __init__(self):
         self.api = TodoistAPI(get_token())
         self.api.sync()
-        self.api.notes = NotesManager(self.api)
-        habit_label_ids = [label['id'] for label in self.api.state['labels'] if label['name']=='habit']
-        assert (len(habit_label_ids)==1)
-        self.habit_label_id = habit_label_ids[0]
+        if getattr(self.api, 'notes', None) is None:
+            self.api.notes = NotesManager(self.api)
+        habit_label_ids = (label['id'] for label in self.api.state['labels'] if label['name']=='habit')
+        habit_label_id = next(habit_label_ids, None)
+        if habit_label_id is None:
+            raise ValueError('Please add a label named habit in Todoist.')
+        if next(habit_label_ids, None) is not None:
+            raise ValueError('Found more than one label named habit in Todoist.')
+        self.habit_label_id = habit_label_id
         self.habits = self.get_habits()
+        logger.debug('habits: %r', self.habits)
         self.get_datetime()
         
 
@@ -161,22 +185,30 @@ class Todoist(object):
         tz_location = tz.gettz(timezone)
         now = datetime.now(tz=tz_location)
         self.weekstart = datetime.weekday(now) == self.api.state['user']['start_day']%7 #Checks if yesterday was the week start day
-        self.off_day = datetime.weekday(now) in [i%7 for i in self.api.state['user']['days_off']] #Checks if yesterday was an off day
+        self.off_day = datetime.weekday(now) in {i%7 for i in self.api.state['user']['days_off']} #Checks if yesterday was an off day
         self.today = now.strftime(TODOIST_DATE_FORMAT)
 
     def get_habits(self):
-        habits = []
-        for item in self.api.state['items']:
-            if self.habit_label_id in item['labels']:
-                habits.append(item)
-        return habits
+        return [item for item in self.api.state['items']
+                if self.habit_label_id in item['labels']]
 
     def update_habit(self):
+        """
+        Queues the note and item updates for every habit and sends them to
+        Todoist in a single commit. Nothing in Task may commit on its own:
+        notes.add and update calls only append commands to api.queue.
+        Habits are processed serially on purpose: the per-habit work is a few
+        dict lookups and integer updates, so a thread pool would only add
+        locking around the SDK's unsynchronised queue.
+        """
+        notes_by_item = defaultdict(list)
+        for note in self.api.state['notes']:
+            notes_by_item[note['item_id']].append(note)
         for item in self.habits:
-            notes = [note for note in self.api.state['notes'] if note['item_id'] == item['id']]
+            notes = notes_by_item.get(item['id'], ())
             task = Task(self.api, item, notes)
             if task.is_due(self.today):
-                task.no_change(self.today, self.weekstart, self.off_day)
+                task.no_change(self.today, weekstart=self.weekstart, day_off=self.off_day)
             else:
                 task.increase(self.weekstart)
         self.api.commit()